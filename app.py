@@ -2,24 +2,47 @@
 SMARTWATT-NEXUS: Electricity Consumption Monitoring & Prediction System
 Main Flask Application
 """
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for, send_file
+from flask import Flask, Response, render_template, request, jsonify, session, redirect, url_for, g
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import insert, inspect
+from sqlalchemy.exc import DataError, IntegrityError, SQLAlchemyError
 from werkzeug.security import generate_password_hash, check_password_hash
 import os
 import json
-from datetime import datetime, timedelta
+import atexit
+import math
+import threading
+from datetime import date, datetime, timedelta
 import numpy as np
-from io import BytesIO
 import csv
+import click
+
+from config import Config
+from utils.cache import TTLCache
+from utils.forecasting import forecast_paths
+from utils.http import FastJSONProvider, StaticFingerprints, compress_response
+from utils.pagination import decode_cursor, encode_cursor, keyset_page, page_size, parse_fields
+from utils.sessions import create_session_interface
+from utils.spool import BadSegmentError, IngestSpool, SpoolFlusher
+from utils.tokens import RateLimiter, bearer_token, generate_token, hash_token
 
 # Initialize Flask App
 app = Flask(__name__, template_folder='../frontend/templates', static_folder='../frontend/static')
+app.config.from_object(Config)
 # Load config from environment with safe defaults for local development
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'smartwatt_nexus_secret_2026')
 app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('SQLALCHEMY_DATABASE_URI', 'sqlite:///smartwatt_nexus.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# Optional server-side session store (SESSION_BACKEND=memory|filesystem)
+_session_interface = create_session_interface(app.config['SESSION_BACKEND'], app.config['SESSION_FILE_DIR'])
+if _session_interface is not None:
+    app.session_interface = _session_interface
+
+# Compact JSON, serialized with orjson when installed
+app.json = FastJSONProvider(app)
+
 # Initialize Database
 db = SQLAlchemy(app)
 CORS(app)
@@ -38,6 +61,7 @@ class User(db.Model):
     password = db.Column(db.String(255), nullable=False)
     name = db.Column(db.String(120), nullable=False)
     meter_id = db.Column(db.String(50), unique=True, nullable=True)
+    is_admin = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())  # fleet operator
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
@@ -57,6 +81,11 @@ class ConsumptionRecord(db.Model):
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     date = db.Column(db.Date, nullable=False)
     
+    __table_args__ = (
+        db.Index('ix_consumption_user_date', 'user_id', 'date', 'id'),
+        db.Index('ix_consumption_date_user', 'date', 'user_id'),  # fleet-wide date ranges
+    )
+    
     def __repr__(self):
         return f'<ConsumptionRecord {self.id}>'
 
@@ -72,6 +101,10 @@ class Alert(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     is_read = db.Column(db.Boolean, default=False)
     
+    __table_args__ = (
+        db.Index('ix_alerts_user_created', 'user_id', 'created_at', 'id'),
+    )
+    
     def __repr__(self):
         return f'<Alert {self.id}>'
 
@@ -87,11 +120,108 @@ class Prediction(db.Model):
     confidence = db.Column(db.Float, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'model_type', 'prediction_date', name='uq_prediction_user_model_date'),
+        db.Index('ix_predictions_user_date', 'user_id', 'prediction_date', 'id'),
+    )
+    
     def __repr__(self):
         return f'<Prediction {self.id}>'
 
+class ApiToken(db.Model):
+    """API Token Model (per meter or scripted client)"""
+    __tablename__ = 'api_tokens'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    name = db.Column(db.String(80), nullable=False)
+    token_hash = db.Column(db.String(64), unique=True, nullable=False)  # HMAC-SHA256, never the token
+    meter_id = db.Column(db.String(50), nullable=True)  # Restricts the token to one meter's readings
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    revoked = db.Column(db.Boolean, default=False)
+    
+    def __repr__(self):
+        return f'<ApiToken {self.id}>'
+
 # ==================== AUTHENTICATION ROUTES ====================
 
+# Verified tokens by digest (False caches unknown tokens); revocation reaches
+# other processes within API_TOKEN_CACHE_TTL
+token_cache = TTLCache(maxsize=Config.API_TOKEN_CACHE_SIZE, ttl=Config.API_TOKEN_CACHE_TTL)
+token_rate_limiter = RateLimiter(Config.API_TOKEN_RATE_LIMIT, period=60)
+
+# Last identity verified for each token digest, without expiry; only consulted
+# for spooled meter ingest while the database is unreachable
+known_tokens = TTLCache(maxsize=Config.API_TOKEN_CACHE_SIZE)
+
+def verify_api_token(token, allow_stale=False):
+    """Identity for a bearer token, or None if it is unknown or revoked.
+    
+    With ``allow_stale``, a database error falls back to the last identity
+    verified for the token; the error is raised if there is none.
+    """
+    digest = hash_token(app.config['SECRET_KEY'], token)
+    identity = token_cache.get(digest)
+    if identity is None:
+        try:
+            row = db.session.query(
+                ApiToken.id, ApiToken.user_id, ApiToken.meter_id, User.username
+            ).join(User, User.id == ApiToken.user_id).filter(
+                ApiToken.token_hash == digest,
+                ApiToken.revoked.is_(False)
+            ).first()
+        except SQLAlchemyError:
+            db.session.rollback()
+            identity = known_tokens.get(digest) if allow_stale else None
+            if identity is None:
+                raise
+            return identity
+        identity = {
+            'token_id': row.id,
+            'user_id': row.user_id,
+            'username': row.username,
+            'meter_id': row.meter_id
+        } if row else False
+        token_cache.set(digest, identity)
+        if identity:
+            known_tokens.set(digest, identity)
+        else:
+            known_tokens.pop(digest)
+    return identity or None
+
+@app.before_request
+def authenticate_api_token():
+    """Resolve Authorization: Bearer tokens before API routes run"""
+    g.api_token = None
+    token = bearer_token(request)
+    if token is None:
+        return None
+    
+    # Spooled ingest keeps accepting known meter tokens while the database is down
+    spooled_ingest = request.endpoint == 'iot_data' and app.config['INGEST_MODE'] == 'spool'
+    try:
+        identity = verify_api_token(token, allow_stale=spooled_ingest)
+    except SQLAlchemyError:
+        if not spooled_ingest:
+            raise
+        return jsonify({'error': 'Token cannot be verified right now; retry later'}), 503
+    if identity is None:
+        return jsonify({'error': 'Invalid API token'}), 401
+    # Meter tokens only upload readings; they are not account credentials
+    if identity['meter_id'] and request.endpoint != 'iot_data':
+        return jsonify({'error': 'Token is limited to meter data uploads'}), 403
+    if not token_rate_limiter.allow(identity['token_id']):
+        return jsonify({'error': 'Rate limit exceeded'}), 429
+    g.api_token = identity
+    return None
+
+def current_user_id():
+    """User id from the API token or, failing that, the session"""
+    if g.get('api_token'):
+        return g.api_token['user_id']
+    return session.get('user_id')
+
+
 @app.route('/register', methods=['GET', 'POST'])
 def register():
     """User Registration"""
@@ -137,7 +267,8 @@ def register():
 @app.route('/api/device/register', methods=['POST'])
 def register_device():
     """Associate a meter/device (Arduino) with a user by meter_id"""
-    if 'user_id' not in session:
+    user_id = current_user_id()
+    if user_id is None:
         return jsonify({'error': 'Not authenticated'}), 401
 
     data = request.get_json() or {}
@@ -148,12 +279,15 @@ def register_device():
 
     # ensure uniqueness
     existing = User.query.filter_by(meter_id=meter_id).first()
-    if existing and existing.id != session['user_id']:
+    if existing and existing.id != user_id:
         return jsonify({'error': 'This meter is already registered to another user'}), 400
 
-    user = User.query.get(session['user_id'])
+    user = User.query.get(user_id)
+    previous_meter_id = user.meter_id
     user.meter_id = meter_id
     db.session.commit()
+    meter_cache.pop(meter_id)
+    meter_cache.pop(previous_meter_id)
     return jsonify({'success': True, 'message': 'Device registered', 'meter_id': meter_id})
 
 
@@ -170,26 +304,27 @@ def iot_data():
     if not meter_id or consumption_kwh is None:
         return jsonify({'error': 'meter_id and consumption_kwh are required'}), 400
 
+    token = g.get('api_token')
+    if token is None and app.config['IOT_REQUIRE_TOKEN']:
+        return jsonify({'error': 'API token required'}), 401
+    if token is not None and token['meter_id'] and token['meter_id'] != meter_id:
+        return jsonify({'error': 'Token is not valid for this meter'}), 403
+
+    if app.config['INGEST_MODE'] == 'spool':
+        return spool_iot_reading(meter_id, consumption_kwh, ts, token)
+
     user = User.query.filter_by(meter_id=meter_id).first()
     if not user:
         return jsonify({'error': 'Unknown meter_id'}), 404
+    if token is not None and token['user_id'] != user.id:
+        return jsonify({'error': 'Token is not valid for this meter'}), 403
 
-    try:
-        if ts:
-            timestamp = datetime.fromisoformat(ts)
-            date_only = timestamp.date()
-        else:
-            timestamp = datetime.utcnow()
-            date_only = timestamp.date()
-    except Exception:
-        timestamp = datetime.utcnow()
-        date_only = timestamp.date()
-
+    timestamp = reading_timestamp(ts)
     record = ConsumptionRecord(
         user_id=user.id,
         consumption_kwh=float(consumption_kwh),
         timestamp=timestamp,
-        date=date_only
+        date=timestamp.date()
     )
     db.session.add(record)
     db.session.commit()
@@ -199,6 +334,73 @@ def iot_data():
 
     return jsonify({'success': True, 'message': 'Data received'}), 201
 
+@app.route('/api/tokens', methods=['GET', 'POST'])
+def api_tokens():
+    """List API tokens, or create one (the token is only returned here)"""
+    # Tokens are managed from a login session; a token cannot mint another one
+    user_id = session.get('user_id')
+    if user_id is None:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        name = data.get('name')
+        meter_id = data.get('meter_id')
+        
+        if not name:
+            return jsonify({'error': 'name is required'}), 400
+        
+        if meter_id and not User.query.filter_by(id=user_id, meter_id=meter_id).first():
+            return jsonify({'error': 'meter_id is not registered to this user'}), 400
+        
+        token = generate_token()
+        api_token = ApiToken(
+            user_id=user_id,
+            name=name,
+            token_hash=hash_token(app.config['SECRET_KEY'], token),
+            meter_id=meter_id or None
+        )
+        db.session.add(api_token)
+        db.session.commit()
+        
+        return jsonify({
+            'success': True,
+            'id': api_token.id,
+            'name': api_token.name,
+            'meter_id': api_token.meter_id,
+            'token': token
+        }), 201
+    
+    tokens = db.session.query(
+        ApiToken.id, ApiToken.name, ApiToken.meter_id, ApiToken.created_at, ApiToken.revoked
+    ).filter(ApiToken.user_id == user_id).order_by(ApiToken.id).all()
+    
+    return jsonify([{
+        'id': t.id,
+        'name': t.name,
+        'meter_id': t.meter_id,
+        'created_at': _iso(t.created_at),
+        'revoked': bool(t.revoked)
+    } for t in tokens])
+
+@app.route('/api/tokens/<int:token_id>', methods=['DELETE'])
+def revoke_api_token(token_id):
+    """Revoke an API token"""
+    user_id = session.get('user_id')
+    if user_id is None:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    api_token = ApiToken.query.filter_by(id=token_id, user_id=user_id).first()
+    if not api_token:
+        return jsonify({'error': 'Token not found'}), 404
+    
+    api_token.revoked = True
+    db.session.commit()
+    token_cache.pop(api_token.token_hash)
+    known_tokens.pop(api_token.token_hash)
+    
+    return jsonify({'success': True, 'message': 'Token revoked'})
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     """User Login"""
@@ -211,6 +413,9 @@ def login():
         user = User.query.filter_by(username=username).first()
         
         if user and check_password_hash(user.password, password):
+            # Never promote a session id the client already had (session fixation)
+            if hasattr(session, 'regenerate'):
+                session.regenerate()
             session['user_id'] = user.id
             session['username'] = user.username
             return jsonify({'success': True, 'message': 'Login successful'}), 200
@@ -303,10 +508,11 @@ def predictions():
 @app.route('/api/user/profile', methods=['GET'])
 def get_user_profile():
     """Get User Profile"""
-    if 'user_id' not in session:
+    user_id = current_user_id()
+    if user_id is None:
         return jsonify({'error': 'Not authenticated'}), 401
     
-    user = User.query.get(session['user_id'])
+    user = User.query.get(user_id)
     return jsonify({
         'id': user.id,
         'username': user.username,
@@ -319,7 +525,8 @@ def get_user_profile():
 @app.route('/api/consumption/add', methods=['POST'])
 def add_consumption():
     """Add Consumption Record"""
-    if 'user_id' not in session:
+    user_id = current_user_id()
+    if user_id is None:
         return jsonify({'error': 'Not authenticated'}), 401
     
     data = request.get_json()
@@ -328,7 +535,6 @@ def add_consumption():
     if not consumption_kwh:
         return jsonify({'error': 'Consumption value required'}), 400
     
-    user_id = session['user_id']
     today = datetime.utcnow().date()
     
     # Create consumption record
@@ -349,10 +555,10 @@ def add_consumption():
 @app.route('/api/consumption/daily', methods=['GET'])
 def get_daily_consumption():
     """Get Daily Consumption Data"""
-    if 'user_id' not in session:
+    user_id = current_user_id()
+    if user_id is None:
         return jsonify({'error': 'Not authenticated'}), 401
     
-    user_id = session['user_id']
     days = request.args.get('days', 30, type=int)
     
     start_date = (datetime.utcnow().date()) - timedelta(days=days)
@@ -365,18 +571,40 @@ def get_daily_consumption():
         ConsumptionRecord.date >= start_date
     ).group_by(ConsumptionRecord.date).order_by(ConsumptionRecord.date).all()
     
+    # ?format=columnar returns {"dates": [...], "values": [...]} for charts
+    if request.args.get('format') == 'columnar':
+        return jsonify({
+            'dates': [str(r.date) for r in records],
+            'values': [float(r.total) for r in records]
+        })
+    
     return jsonify([{
         'date': str(r.date),
         'consumption': float(r.total)
     } for r in records])
 
+@app.route('/api/consumption/readings', methods=['GET'])
+def get_consumption_readings():
+    """Get Raw Consumption Readings (newest first, cursor paginated)"""
+    user_id = current_user_id()
+    if user_id is None:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    filters = [ConsumptionRecord.user_id == user_id]
+    days = request.args.get('days', type=int)
+    if days:
+        filters.append(ConsumptionRecord.date >= datetime.utcnow().date() - timedelta(days=days))
+    
+    return paginated_list(READING_FIELDS, filters, ConsumptionRecord.date, ConsumptionRecord.id,
+                          date.fromisoformat)
+
 @app.route('/api/consumption/current', methods=['GET'])
 def get_current_consumption():
     """Get Current Consumption (Today)"""
-    if 'user_id' not in session:
+    user_id = current_user_id()
+    if user_id is None:
         return jsonify({'error': 'Not authenticated'}), 401
     
-    user_id = session['user_id']
     today = datetime.utcnow().date()
     
     total = db.session.query(db.func.sum(ConsumptionRecord.consumption_kwh)).filter(
@@ -388,110 +616,71 @@ def get_current_consumption():
 
 @app.route('/api/predictions/generate', methods=['POST'])
 def generate_predictions():
-    """Generate ML Predictions"""
-    if 'user_id' not in session:
+    """Generate ML Predictions (next day plus multi-day horizons)"""
+    user_id = current_user_id()
+    if user_id is None:
         return jsonify({'error': 'Not authenticated'}), 401
     
-    user_id = session['user_id']
-    
-    # Get historical data
-    records = ConsumptionRecord.query.filter_by(user_id=user_id).order_by(ConsumptionRecord.date).all()
-    
-    if len(records) < 5:
+    forecast = generate_horizon_forecast(user_id)
+    if forecast is None:
         return jsonify({'error': 'Insufficient data for predictions'}), 400
     
-    consumption_data = [r.consumption_kwh for r in records[-30:]]
-    
-    # Import ML models lazily to avoid heavy startup imports; fall back to simple average predictor
-    try:
-        from utils.ml_models import LSTMPredictor, RegressionPredictor, ANNPredictor
-    except Exception:
-        class _FallbackPredictor:
-            @staticmethod
-            def predict(data):
-                if not data:
-                    return 0.0
-                return float(sum(data) / len(data))
-
-        LSTMPredictor = RegressionPredictor = ANNPredictor = _FallbackPredictor
-
-    # Generate predictions using different models
-    try:
-        lstm_pred = float(LSTMPredictor.predict(consumption_data))
-    except Exception:
-        lstm_pred = float(sum(consumption_data) / len(consumption_data))
-
-    try:
-        regression_pred = float(RegressionPredictor.predict(consumption_data))
-    except Exception:
-        regression_pred = float(sum(consumption_data) / len(consumption_data))
+    next_day = {model: values[0] for model, values in forecast['models'].items()}
+    return jsonify({
+        'lstm': next_day['LSTM'],
+        'regression': next_day['REGRESSION'],
+        'ann': next_day['ANN'],
+        'average': forecast['average'][0],
+        'horizons': forecast['horizons'],
+        'bill_projection': forecast['bill_projection']
+    })
 
-    try:
-        ann_pred = float(ANNPredictor.predict(consumption_data))
-    except Exception:
-        ann_pred = float(sum(consumption_data) / len(consumption_data))
+@app.route('/api/predictions/forecast', methods=['GET'])
+def get_forecast():
+    """Get Stored Horizon Forecast"""
+    user_id = current_user_id()
+    if user_id is None:
+        return jsonify({'error': 'Not authenticated'}), 401
     
-    tomorrow = datetime.utcnow().date() + timedelta(days=1)
+    days = request.args.get('days', 7, type=int)
+    days = max(1, min(days, max(app.config['FORECAST_HORIZONS'])))
     
-    # Store predictions
-    for model_type, pred_value, confidence in [
-        ('LSTM', lstm_pred, 0.85),
-        ('REGRESSION', regression_pred, 0.78),
-        ('ANN', ann_pred, 0.82)
-    ]:
-        prediction = Prediction(
-            user_id=user_id,
-            predicted_consumption=pred_value,
-            model_type=model_type,
-            prediction_date=tomorrow,
-            confidence=confidence
-        )
-        db.session.add(prediction)
-    
-    db.session.commit()
+    forecast = stored_horizon_forecast(user_id)
+    if forecast is None:
+        return jsonify({'error': 'No forecast yet; generate predictions first'}), 404
     
     return jsonify({
-        'lstm': float(lstm_pred),
-        'regression': float(regression_pred),
-        'ann': float(ann_pred),
-        'average': float((lstm_pred + regression_pred + ann_pred) / 3)
+        'dates': forecast['dates'][:days],
+        'models': {model: values[:days] for model, values in forecast['models'].items()},
+        'average': forecast['average'][:days],
+        'horizons': forecast['horizons'],
+        'bill_projection': forecast['bill_projection'],
+        'generated_at': forecast['generated_at']
     })
 
 @app.route('/api/predictions/get', methods=['GET'])
 def get_predictions():
-    """Get Stored Predictions"""
-    if 'user_id' not in session:
+    """Get Stored Predictions (upcoming dates first, cursor paginated)"""
+    user_id = current_user_id()
+    if user_id is None:
         return jsonify({'error': 'Not authenticated'}), 401
     
-    user_id = session['user_id']
-    predictions = Prediction.query.filter_by(user_id=user_id).order_by(Prediction.prediction_date.desc()).limit(30).all()
-    
-    return jsonify([{
-        'date': str(p.prediction_date),
-        'model': p.model_type,
-        'predicted_consumption': float(p.predicted_consumption),
-        'confidence': float(p.confidence)
-    } for p in predictions])
+    filters = [
+        Prediction.user_id == user_id,
+        Prediction.prediction_date > datetime.utcnow().date()
+    ]
+    return paginated_list(PREDICTION_FIELDS, filters, Prediction.prediction_date, Prediction.id,
+                          date.fromisoformat, descending=False)
 
 @app.route('/api/bill/estimate', methods=['GET'])
 def estimate_bill():
     """Estimate Electricity Bill"""
-    if 'user_id' not in session:
+    user_id = current_user_id()
+    if user_id is None:
         return jsonify({'error': 'Not authenticated'}), 401
     
-    user_id = session['user_id']
     days = request.args.get('days', 30, type=int)
     
-    # TS Electric Department rates (per unit costs)
-    # These are example rates, update with actual TS rates
-    slab_rates = [
-        {'from': 0, 'to': 50, 'rate': 2.80},        # 0-50 units: Rs. 2.80/unit
-        {'from': 50, 'to': 100, 'rate': 3.40},      # 51-100 units: Rs. 3.40/unit
-        {'from': 100, 'to': 200, 'rate': 4.60},     # 101-200 units: Rs. 4.60/unit
-        {'from': 200, 'to': 500, 'rate': 6.00},     # 201-500 units: Rs. 6.00/unit
-        {'from': 500, 'to': float('inf'), 'rate': 7.50}  # 500+ units: Rs. 7.50/unit
-    ]
-    
     start_date = (datetime.utcnow().date()) - timedelta(days=days)
     today = datetime.utcnow().date()
     
@@ -501,63 +690,52 @@ def estimate_bill():
         ConsumptionRecord.date <= today
     ).scalar() or 0
     
-    total_consumption = float(total_consumption)
-    
-    # Calculate bill based on slabs
-    bill_amount = 0
-    consumed = 0
-    
-    for slab in slab_rates:
-        if consumed >= total_consumption:
-            break
-        
-        slab_limit = min(slab['to'], total_consumption)
-        units_in_slab = max(0, slab_limit - consumed)
-        bill_amount += units_in_slab * slab['rate']
-        consumed = slab_limit
-    
-    # Add taxes and charges
-    fixed_charge = 100  # Fixed monthly charge
-    tax_rate = 0.10  # 10% tax
-    
-    subtotal = bill_amount + fixed_charge
-    tax_amount = subtotal * tax_rate
-    total_bill = subtotal + tax_amount
-    
-    return jsonify({
-        'consumption': total_consumption,
-        'bill_amount': round(float(bill_amount), 2),
-        'fixed_charge': fixed_charge,
-        'tax': round(float(tax_amount), 2),
-        'total_bill': round(float(total_bill), 2),
-        'period_days': days
-    })
+    bill = calculate_bill(float(total_consumption))
+    bill['period_days'] = days
+    return jsonify(bill)
 
 @app.route('/api/alerts/get', methods=['GET'])
 def get_alerts():
-    """Get User Alerts"""
-    if 'user_id' not in session:
+    """Get User Alerts (newest first, cursor paginated)"""
+    user_id = current_user_id()
+    if user_id is None:
         return jsonify({'error': 'Not authenticated'}), 401
     
-    user_id = session['user_id']
-    alerts = Alert.query.filter_by(user_id=user_id).order_by(Alert.created_at.desc()).limit(20).all()
+    filters = [Alert.user_id == user_id]
+    if request.args.get('unread', type=int):
+        filters.append(Alert.is_read.is_(False))
     
-    return jsonify([{
-        'id': a.id,
-        'type': a.alert_type,
-        'message': a.message,
-        'consumption_value': float(a.consumption_value),
-        'created_at': a.created_at.isoformat(),
-        'is_read': a.is_read
-    } for a in alerts])
+    return paginated_list(ALERT_FIELDS, filters, Alert.created_at, Alert.id, datetime.fromisoformat)
+
+@app.route('/api/alerts/mark-read', methods=['POST'])
+def mark_alerts_read():
+    """Mark alerts as read in bulk ({"ids": [...]} or {"all": true})"""
+    user_id = current_user_id()
+    if user_id is None:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    data = request.get_json(silent=True) or {}
+    ids = data.get('ids')
+    query = Alert.query.filter(Alert.user_id == user_id, Alert.is_read.is_(False))
+    
+    if ids:
+        if not isinstance(ids, list) or not all(isinstance(i, int) for i in ids):
+            return jsonify({'error': 'ids must be a list of integers'}), 400
+        query = query.filter(Alert.id.in_(ids))
+    elif not data.get('all'):
+        return jsonify({'error': 'ids or all is required'}), 400
+    
+    updated = query.update({Alert.is_read: True}, synchronize_session=False)
+    db.session.commit()
+    return jsonify({'success': True, 'updated': updated})
 
 @app.route('/api/reports/download', methods=['GET'])
 def download_report():
     """Download Consumption Report as CSV"""
-    if 'user_id' not in session:
+    user_id = current_user_id()
+    if user_id is None:
         return jsonify({'error': 'Not authenticated'}), 401
     
-    user_id = session['user_id']
     user = User.query.get(user_id)
     days = request.args.get('days', 30, type=int)
     
@@ -575,15 +753,465 @@ def download_report():
 
     csv_data = "\n".join(csv_lines) + "\n"
     filename_id = user.meter_id if user.meter_id else (user.username or str(user.id))
-    return send_file(
-        BytesIO(csv_data.encode('utf-8')),
-        mimetype='text/csv',
-        as_attachment=True,
-        download_name=f'consumption_report_{filename_id}.csv'
-    )
+    # A buffered response (unlike send_file) can be compressed after the request
+    response = Response(csv_data, mimetype='text/csv')
+    response.headers.set('Content-Disposition', 'attachment',
+                         filename=f'consumption_report_{filename_id}.csv')
+    return response
+
+# ==================== ADMIN / FLEET ROUTES ====================
+
+def _fleet_args():
+    interval = request.args.get('interval', 'day')
+    days = max(1, min(request.args.get('days', 30, type=int), app.config['FLEET_MAX_DAYS']))
+    return interval, days
+
+@app.route('/api/admin/fleet/load', methods=['GET'])
+def fleet_load():
+    """Fleet-wide total load per interval across all meters"""
+    user_id = current_user_id()
+    if user_id is None:
+        return jsonify({'error': 'Not authenticated'}), 401
+    if not is_admin():
+        return jsonify({'error': 'Admin access required'}), 403
+    
+    interval, days = _fleet_args()
+    if interval not in FLEET_INTERVALS:
+        return jsonify({'error': 'interval must be hour or day'}), 400
+    
+    intervals, totals, meters = fleet_load_curve(interval, days)
+    peak = int(totals.argmax()) if totals.size else None
+    return jsonify({
+        'interval': interval,
+        'days': days,
+        'intervals': intervals,
+        'total': np.round(totals, 3).tolist(),
+        'meters': meters.tolist(),
+        'peak_interval': intervals[peak] if peak is not None else None,
+        'peak_load': round(float(totals[peak]), 3) if peak is not None else 0.0,
+        'mean_load': round(float(totals.mean()), 3) if totals.size else 0.0
+    })
+
+@app.route('/api/admin/fleet/load-duration', methods=['GET'])
+def fleet_load_duration():
+    """Fleet load-duration curve (interval loads sorted high to low)"""
+    user_id = current_user_id()
+    if user_id is None:
+        return jsonify({'error': 'Not authenticated'}), 401
+    if not is_admin():
+        return jsonify({'error': 'Admin access required'}), 403
+    
+    interval, days = _fleet_args()
+    if interval not in FLEET_INTERVALS:
+        return jsonify({'error': 'interval must be hour or day'}), 400
+    
+    _, totals, _ = fleet_load_curve(interval, days)
+    loads = np.sort(totals)[::-1]
+    percent = np.arange(1, loads.size + 1) * 100.0 / max(loads.size, 1)
+    return jsonify({
+        'interval': interval,
+        'days': days,
+        'load': np.round(loads, 3).tolist(),
+        'percent_of_time': np.round(percent, 2).tolist()
+    })
+
+@app.route('/api/admin/fleet/top-consumers', methods=['GET'])
+def fleet_top_consumers():
+    """Top-N consumers across the fleet"""
+    user_id = current_user_id()
+    if user_id is None:
+        return jsonify({'error': 'Not authenticated'}), 401
+    if not is_admin():
+        return jsonify({'error': 'Admin access required'}), 403
+    
+    _, days = _fleet_args()
+    n = max(1, min(request.args.get('n', 10, type=int), app.config['MAX_ITEMS_PER_PAGE']))
+    
+    key = ('top', days, n)
+    result = fleet_cache.get(key)
+    if result is None:
+        start_date = datetime.utcnow().date() - timedelta(days=days)
+        rows = db.session.query(
+            ConsumptionRecord.user_id,
+            db.func.sum(ConsumptionRecord.consumption_kwh)
+        ).filter(ConsumptionRecord.date >= start_date).group_by(ConsumptionRecord.user_id).all()
+        
+        result = []
+        if rows:
+            user_ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+            totals = np.fromiter((r[1] or 0.0 for r in rows), dtype=np.float64, count=len(rows))
+            top = np.argpartition(-totals, min(n, totals.size) - 1)[:n]
+            top = top[np.argsort(-totals[top])]
+            fleet_total = totals.sum()
+            
+            users = {u.id: u for u in db.session.query(User.id, User.username, User.meter_id).filter(
+                User.id.in_(user_ids[top].tolist()))}
+            for i in top:
+                user = users.get(int(user_ids[i]))
+                result.append({
+                    'user_id': int(user_ids[i]),
+                    'username': user.username if user else None,
+                    'meter_id': user.meter_id if user else None,
+                    'consumption': round(float(totals[i]), 3),
+                    'share': round(float(totals[i] / fleet_total), 4) if fleet_total else 0.0
+                })
+        fleet_cache.set(key, result, ttl=app.config['FLEET_CACHE_TTL']['day'])
+    
+    return jsonify({'days': days, 'consumers': result})
+
+@app.route('/api/admin/anomalies/scan', methods=['POST'])
+def fleet_anomaly_scan():
+    """Run the fleet-wide anomaly scanner"""
+    user_id = current_user_id()
+    if user_id is None:
+        return jsonify({'error': 'Not authenticated'}), 401
+    if not is_admin():
+        return jsonify({'error': 'Admin access required'}), 403
+    
+    counts = scan_fleet_anomalies()
+    return jsonify({'success': True, 'alerts_created': counts})
 
 # ==================== UTILITY FUNCTIONS ====================
 
+MODEL_CONFIDENCE = {'LSTM': 0.85, 'REGRESSION': 0.78, 'ANN': 0.82}
+
+def calculate_bill(total_consumption):
+    """Apply the tariff slabs, fixed charge and tax to a consumption total"""
+    bill_amount = 0
+    consumed = 0
+    
+    for slab in app.config['TARIFF_SLABS']:
+        if consumed >= total_consumption:
+            break
+        
+        slab_limit = min(slab['to'], total_consumption)
+        units_in_slab = max(0, slab_limit - consumed)
+        bill_amount += units_in_slab * slab['rate']
+        consumed = slab_limit
+    
+    fixed_charge = app.config['FIXED_CHARGE']
+    subtotal = bill_amount + fixed_charge
+    tax_amount = subtotal * app.config['TAX_RATE']
+    total_bill = subtotal + tax_amount
+    
+    return {
+        'consumption': total_consumption,
+        'bill_amount': round(float(bill_amount), 2),
+        'fixed_charge': fixed_charge,
+        'tax': round(float(tax_amount), 2),
+        'total_bill': round(float(total_bill), 2)
+    }
+
+def predict_next_day(consumption_data):
+    """Next-day prediction from each model, falling back to the mean"""
+    # Import ML models lazily to avoid heavy startup imports; fall back to simple average predictor
+    try:
+        from utils.ml_models import LSTMPredictor, RegressionPredictor, ANNPredictor
+    except Exception:
+        class _FallbackPredictor:
+            @staticmethod
+            def predict(data):
+                if not data:
+                    return 0.0
+                return float(sum(data) / len(data))
+
+        LSTMPredictor = RegressionPredictor = ANNPredictor = _FallbackPredictor
+
+    average = float(sum(consumption_data) / len(consumption_data))
+    predictions = {}
+    for model_type, predictor in [
+        ('LSTM', LSTMPredictor),
+        ('REGRESSION', RegressionPredictor),
+        ('ANN', ANNPredictor)
+    ]:
+        try:
+            predictions[model_type] = float(predictor.predict(consumption_data))
+        except Exception:
+            predictions[model_type] = average
+    return predictions
+
+def save_predictions(user_id, predictions, start_date):
+    """Upsert daily predictions by (user, model, date); the caller commits.
+    
+    ``predictions`` maps model type to a sequence of daily values, the first
+    of which is for ``start_date``.
+    """
+    horizon = max(len(values) for values in predictions.values())
+    end_date = start_date + timedelta(days=horizon - 1)
+    existing = {
+        (p.model_type, p.prediction_date): p
+        for p in Prediction.query.filter(
+            Prediction.user_id == user_id,
+            Prediction.model_type.in_(list(predictions)),
+            Prediction.prediction_date >= start_date,
+            Prediction.prediction_date <= end_date
+        )
+    }
+    now = datetime.utcnow()
+    for model_type, values in predictions.items():
+        confidence = MODEL_CONFIDENCE.get(model_type, 0.0)
+        for offset, pred_value in enumerate(values):
+            prediction_date = start_date + timedelta(days=offset)
+            prediction = existing.get((model_type, prediction_date))
+            if prediction is None:
+                db.session.add(Prediction(
+                    user_id=user_id,
+                    predicted_consumption=float(pred_value),
+                    model_type=model_type,
+                    prediction_date=prediction_date,
+                    confidence=confidence
+                ))
+            else:
+                prediction.predicted_consumption = float(pred_value)
+                prediction.confidence = confidence
+                prediction.created_at = now
+
+def generate_horizon_forecast(user_id):
+    """Rerun the models for a user and store their horizon forecasts.
+    
+    Returns None when there is not enough history to forecast.
+    """
+    today = datetime.utcnow().date()
+    start_date = today - timedelta(days=app.config['TRAINING_HISTORY_DAYS'])
+    rows = db.session.query(
+        ConsumptionRecord.date,
+        db.func.sum(ConsumptionRecord.consumption_kwh).label('total')
+    ).filter(
+        ConsumptionRecord.user_id == user_id,
+        ConsumptionRecord.date >= start_date,
+        ConsumptionRecord.date <= today
+    ).group_by(ConsumptionRecord.date).order_by(ConsumptionRecord.date).all()
+    
+    if len(rows) < 5:
+        return None
+    
+    values = [float(r.total) for r in rows]
+    ordinals = [r.date.toordinal() for r in rows]
+    horizon = max(app.config['FORECAST_HORIZONS'])
+    tomorrow = today + timedelta(days=1)
+    
+    models, paths = forecast_paths(predict_next_day(values), ordinals, values,
+                                   tomorrow.toordinal(), horizon)
+    paths = np.round(paths, 3)
+    
+    save_predictions(user_id, dict(zip(models, paths.tolist())), tomorrow)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # A concurrent request inserted the same rows first; update them instead
+        db.session.rollback()
+        save_predictions(user_id, dict(zip(models, paths.tolist())), tomorrow)
+        db.session.commit()
+    
+    return build_forecast(user_id, today, models, paths, datetime.utcnow())
+
+def stored_horizon_forecast(user_id):
+    """Horizon forecasts read back from the stored predictions.
+    
+    Covers the leading run of days from tomorrow that every model has a
+    prediction for; None if there is none yet.
+    """
+    today = datetime.utcnow().date()
+    tomorrow = today + timedelta(days=1)
+    horizon = max(app.config['FORECAST_HORIZONS'])
+    
+    by_model, generated_at = {}, None
+    for prediction in Prediction.query.filter(
+        Prediction.user_id == user_id,
+        Prediction.prediction_date >= tomorrow,
+        Prediction.prediction_date < tomorrow + timedelta(days=horizon)
+    ):
+        by_model.setdefault(prediction.model_type, {})[prediction.prediction_date] = prediction.predicted_consumption
+        if generated_at is None or (prediction.created_at and prediction.created_at > generated_at):
+            generated_at = prediction.created_at
+    
+    models = [model for model in MODEL_CONFIDENCE if model in by_model]
+    dates = []
+    for offset in range(horizon):
+        day = tomorrow + timedelta(days=offset)
+        if not models or any(day not in by_model[model] for model in models):
+            break
+        dates.append(day)
+    if not dates:
+        return None
+    
+    paths = np.array([[by_model[model][day] for day in dates] for model in models])
+    return build_forecast(user_id, today, models, paths, generated_at)
+
+def build_forecast(user_id, today, models, paths, generated_at):
+    """Forecast response from daily paths (models x days, starting tomorrow).
+    
+    Horizons, and the bill projection, are left out when the paths are too
+    short to cover them.
+    """
+    tomorrow = today + timedelta(days=1)
+    average = np.round(paths.mean(axis=0), 3)
+    
+    horizons = {}
+    for days in app.config['FORECAST_HORIZONS']:
+        if days > paths.shape[1]:
+            continue
+        totals = paths[:, :days].sum(axis=1)
+        horizons[str(days)] = dict(zip(models, np.round(totals, 3).tolist()))
+        horizons[str(days)]['average'] = round(float(totals.mean()), 3)
+    
+    # End-of-cycle projection: month to date plus forecasts for the remaining days
+    cycle_start = today.replace(day=1)
+    cycle_end = (cycle_start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    bill_projection = None
+    if (cycle_end - today).days <= paths.shape[1]:
+        to_date = db.session.query(db.func.sum(ConsumptionRecord.consumption_kwh)).filter(
+            ConsumptionRecord.user_id == user_id,
+            ConsumptionRecord.date >= cycle_start,
+            ConsumptionRecord.date <= today
+        ).scalar() or 0
+        remaining = float(average[:(cycle_end - today).days].sum())
+        bill_projection = calculate_bill(round(float(to_date) + remaining, 3))
+        bill_projection.update({
+            'cycle_start': str(cycle_start),
+            'cycle_end': str(cycle_end),
+            'consumption_to_date': round(float(to_date), 3)
+        })
+    
+    return {
+        'generated_at': generated_at.isoformat() if generated_at else None,
+        'dates': [str(tomorrow + timedelta(days=i)) for i in range(paths.shape[1])],
+        'models': dict(zip(models, paths.tolist())),
+        'average': average.tolist(),
+        'horizons': horizons,
+        'bill_projection': bill_projection
+    }
+
+FLEET_INTERVALS = ('hour', 'day')
+
+# Fleet aggregates, cached for a period matching their interval
+fleet_cache = TTLCache(maxsize=256)
+
+def is_admin():
+    """Whether the logged-in user (or token owner) is a fleet operator"""
+    user_id = current_user_id()
+    if user_id is None:
+        return False
+    return bool(db.session.query(User.is_admin).filter(User.id == user_id).scalar())
+
+def hour_bucket(column):
+    """SQL expression truncating a timestamp column to the hour"""
+    if db.engine.dialect.name == 'postgresql':
+        return db.func.date_trunc('hour', column)
+    return db.func.strftime('%Y-%m-%d %H:00:00', column)
+
+def as_datetime(value):
+    """Normalise a bucket value returned by hour_bucket() or a date column"""
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime.combine(value, datetime.min.time())
+    return datetime.fromisoformat(value)
+
+def fleet_load_curve(interval, days):
+    """Total load and active meter count per interval across all meters.
+    
+    Returns (interval labels, totals, meter counts) from one grouped query.
+    """
+    key = ('load', interval, days)
+    cached = fleet_cache.get(key)
+    if cached is not None:
+        return cached
+    
+    start_date = datetime.utcnow().date() - timedelta(days=days)
+    bucket = ConsumptionRecord.date if interval == 'day' else hour_bucket(ConsumptionRecord.timestamp)
+    rows = db.session.query(
+        bucket.label('bucket'),
+        db.func.sum(ConsumptionRecord.consumption_kwh),
+        db.func.count(db.distinct(ConsumptionRecord.user_id))
+    ).filter(ConsumptionRecord.date >= start_date).group_by(bucket).order_by(bucket).all()
+    
+    rows = [r for r in rows if r[0] is not None]
+    intervals = [as_datetime(r[0]).isoformat() for r in rows]
+    totals = np.fromiter((r[1] or 0.0 for r in rows), dtype=np.float64, count=len(rows))
+    meters = np.fromiter((r[2] for r in rows), dtype=np.int64, count=len(rows))
+    
+    result = (intervals, totals, meters)
+    fleet_cache.set(key, result, ttl=app.config['FLEET_CACHE_TTL'][interval])
+    return result
+
+def _iso(value):
+    return value.isoformat() if value is not None else None
+
+# Public field name -> (column, serializer) for the paginated list APIs
+ALERT_FIELDS = {
+    'id': (Alert.id, int),
+    'type': (Alert.alert_type, str),
+    'message': (Alert.message, str),
+    'consumption_value': (Alert.consumption_value, float),
+    'created_at': (Alert.created_at, _iso),
+    'is_read': (Alert.is_read, bool)
+}
+
+PREDICTION_FIELDS = {
+    'id': (Prediction.id, int),
+    'date': (Prediction.prediction_date, str),
+    'model': (Prediction.model_type, str),
+    'predicted_consumption': (Prediction.predicted_consumption, float),
+    'confidence': (Prediction.confidence, float)
+}
+
+READING_FIELDS = {
+    'id': (ConsumptionRecord.id, int),
+    'date': (ConsumptionRecord.date, str),
+    'timestamp': (ConsumptionRecord.timestamp, _iso),
+    'consumption_kwh': (ConsumptionRecord.consumption_kwh, float)
+}
+
+def paginated_list(fields_map, filters, sort_column, id_column, parse_key, descending=True):
+    """Keyset-paginated, column-only list response for the current request.
+    
+    Honours ``limit``, ``cursor`` and ``fields`` query parameters. The body
+    stays a plain JSON list; the next page's cursor is returned in the
+    ``X-Next-Cursor`` and ``Link`` headers.
+    """
+    try:
+        fields = parse_fields(request.args.get('fields'), fields_map)
+        cursor = request.args.get('cursor')
+        after = decode_cursor(cursor, parse_key) if cursor else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    limit = page_size(request.args.get('limit', type=int),
+                      app.config['ITEMS_PER_PAGE'], app.config['MAX_ITEMS_PER_PAGE'])
+    
+    # Select only the requested columns plus the keyset columns
+    columns = {fields_map[f][0].key: fields_map[f][0] for f in fields}
+    columns.setdefault(sort_column.key, sort_column)
+    columns.setdefault(id_column.key, id_column)
+    query = db.session.query(*columns.values()).filter(*filters)
+    rows, last_key = keyset_page(query, sort_column, id_column, after, limit, descending)
+    
+    response = jsonify([{
+        f: (None if getattr(row, fields_map[f][0].key) is None
+            else fields_map[f][1](getattr(row, fields_map[f][0].key)))
+        for f in fields
+    } for row in rows])
+    if last_key is not None:
+        next_cursor = encode_cursor(*last_key)
+        args = request.args.to_dict()
+        args['cursor'] = next_cursor
+        response.headers['X-Next-Cursor'] = next_cursor
+        response.headers['Link'] = f'<{url_for(request.endpoint, **args)}>; rel="next"'
+    return response
+
+def reading_timestamp(ts):
+    """Timestamp of a meter reading, shared by direct and spooled ingest.
+    
+    The meter's own clock time (and so its local date) is kept and any UTC
+    offset dropped; a missing or invalid timestamp means now (UTC).
+    """
+    try:
+        timestamp = datetime.fromisoformat(ts) if ts else datetime.utcnow()
+    except (TypeError, ValueError):
+        timestamp = datetime.utcnow()
+    return timestamp.replace(tzinfo=None)
+
 def check_consumption_anomaly(user_id, current_consumption):
     """Check for consumption anomalies and create alerts"""
     
@@ -608,6 +1236,421 @@ def check_consumption_anomaly(user_id, current_consumption):
             db.session.add(alert)
             db.session.commit()
 
+def check_consumption_anomalies(peaks):
+    """check_consumption_anomaly for many users at once ({user_id: reading})"""
+    seven_days_ago = (datetime.utcnow().date()) - timedelta(days=7)
+    user_ids = list(peaks)
+    averages = {}
+    for i in range(0, len(user_ids), 500):
+        averages.update(db.session.query(
+            ConsumptionRecord.user_id,
+            db.func.avg(ConsumptionRecord.consumption_kwh)
+        ).filter(
+            ConsumptionRecord.user_id.in_(user_ids[i:i + 500]),
+            ConsumptionRecord.date >= seven_days_ago
+        ).group_by(ConsumptionRecord.user_id).all())
+    
+    now = datetime.utcnow()
+    alerts = [{
+        'user_id': user_id,
+        'alert_type': 'HIGH_CONSUMPTION',
+        'message': f'High consumption detected: {current_consumption:.2f} kWh (30% above average)',
+        'consumption_value': current_consumption,
+        'created_at': now,
+        'is_read': False
+    } for user_id, current_consumption in peaks.items()
+        if averages.get(user_id) and current_consumption > averages[user_id] * 1.3]
+    if alerts:
+        db.session.execute(insert(Alert), alerts)
+        db.session.commit()
+    return len(alerts)
+
+# Alert type -> message template for the batch anomaly scanner
+SCAN_ALERT_MESSAGES = {
+    'DRIFT': 'Sustained consumption increase: {value:.2f} kWh/day over the last 3 days (z-score {score:.1f})',
+    'ANOMALY': 'Unusual daily consumption: {value:.2f} kWh (robust score {score:.1f})',
+    'STUCK_METER': 'Meter reported the same value ({value:.2f} kWh) for {score:.0f} consecutive hours',
+    'DATA_GAP': 'No readings received for {score:.0f} consecutive hours',
+    'NIGHT_BASELOAD': 'Night-time baseload rose to {value:.2f} kWh/h (usual {score:.2f} kWh/h)'
+}
+
+def load_hourly_matrix(start, end):
+    """(users x hours) matrix of consumption between start and end (exclusive).
+    
+    Hours without readings are NaN. Built from one grouped query.
+    """
+    bucket = hour_bucket(ConsumptionRecord.timestamp)
+    rows = db.session.query(
+        ConsumptionRecord.user_id,
+        bucket.label('bucket'),
+        db.func.sum(ConsumptionRecord.consumption_kwh)
+    ).filter(
+        ConsumptionRecord.date >= start.date(),
+        ConsumptionRecord.timestamp >= start,
+        ConsumptionRecord.timestamp < end
+    ).group_by(ConsumptionRecord.user_id, bucket).all()
+    
+    hours = int((end - start).total_seconds() // 3600)
+    rows = [r for r in rows if r[1] is not None]
+    if not rows:
+        return np.array([], dtype=np.int64), np.full((0, hours), np.nan)
+    
+    user_ids, user_index = np.unique(np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows)),
+                                     return_inverse=True)
+    buckets = np.array([as_datetime(r[1]) for r in rows], dtype='datetime64[s]')
+    hour_index = ((buckets - np.datetime64(start, 's')) // np.timedelta64(1, 'h')).astype(np.int64)
+    totals = np.fromiter((r[2] or 0.0 for r in rows), dtype=np.float64, count=len(rows))
+    
+    valid = (hour_index >= 0) & (hour_index < hours)
+    matrix = np.full((user_ids.size, hours), np.nan)
+    matrix[user_index[valid], hour_index[valid]] = totals[valid]
+    return user_ids, matrix
+
+def scan_fleet_anomalies(now=None):
+    """Run the vectorized detectors over every user and bulk-insert new alerts.
+    
+    Alerts already raised for the same user and type within
+    ANOMALY_DEDUP_HOURS are not repeated. Returns counts per alert type.
+    """
+    from utils import anomaly
+    
+    now = now or datetime.utcnow()
+    days = app.config['ANOMALY_SCAN_DAYS']
+    today = datetime.combine(now.date(), datetime.min.time())
+    start = today - timedelta(days=days)
+    end = now.replace(minute=0, second=0, microsecond=0)
+    
+    # Complete days feed the daily detectors; the partial current day only
+    # extends the flatline and gap windows. Stuck meters and gaps are only
+    # reported while they reach into the dedup window, so one outage that
+    # has ended is not alerted again on every scan.
+    recent = app.config['ANOMALY_DEDUP_HOURS']
+    user_ids, hourly = load_hourly_matrix(start, end)
+    if user_ids.size == 0:
+        return {}
+    daily = anomaly.daily_matrix(hourly, days)
+    
+    detections = {}
+    flagged, value, score = anomaly.rolling_zscore(daily, threshold=app.config['ANOMALY_SENSITIVITY'])
+    detections['DRIFT'] = (flagged, value, score)
+    flagged, value, score = anomaly.mad_outliers(daily)
+    detections['ANOMALY'] = (flagged, value, score)
+    flagged, value, runs = anomaly.flatline(hourly, app.config['FLATLINE_HOURS'], recent)
+    detections['STUCK_METER'] = (flagged, value, runs)
+    flagged, gaps = anomaly.data_gaps(hourly, app.config['DATA_GAP_HOURS'], recent,
+                                      app.config['DATA_GAP_INTERVALS'])
+    detections['DATA_GAP'] = (flagged, np.zeros(gaps.size), gaps)
+    flagged, value, baseline = anomaly.night_baseload(hourly, days, app.config['NIGHT_BASELOAD_RATIO'])
+    detections['NIGHT_BASELOAD'] = (flagged, value, baseline)
+    
+    flagged_users = set()
+    for flagged, _, _ in detections.values():
+        flagged_users.update(user_ids[flagged].tolist())
+    if not flagged_users:
+        return {alert_type: 0 for alert_type in detections}
+    
+    since = now - timedelta(hours=app.config['ANOMALY_DEDUP_HOURS'])
+    existing = {tuple(r) for r in db.session.query(Alert.user_id, Alert.alert_type).filter(
+        Alert.user_id.in_(flagged_users),
+        Alert.alert_type.in_(list(detections)),
+        Alert.created_at >= since
+    ).distinct()}
+    
+    new_alerts = []
+    counts = {}
+    for alert_type, (flagged, value, score) in detections.items():
+        counts[alert_type] = 0
+        for i in np.flatnonzero(flagged):
+            user_id = int(user_ids[i])
+            if (user_id, alert_type) in existing:
+                continue
+            v = float(value[i]) if np.isfinite(value[i]) else 0.0
+            new_alerts.append({
+                'user_id': user_id,
+                'alert_type': alert_type,
+                'message': SCAN_ALERT_MESSAGES[alert_type].format(value=v, score=float(score[i]))[:255],
+                'consumption_value': v,
+                'created_at': now,
+                'is_read': False
+            })
+            counts[alert_type] += 1
+    
+    if new_alerts:
+        db.session.execute(insert(Alert), new_alerts)
+        db.session.commit()
+    return counts
+
+# ==================== INGEST SPOOL ====================
+
+# meter_id -> user id (False for unknown meters), shared by spooled ingest
+meter_cache = TTLCache(maxsize=100000, ttl=60)
+
+_ingest_spool = None
+_ingest_spool_lock = threading.Lock()
+
+def meter_user_id(meter_id):
+    """User id owning a meter, or None; cached for a minute"""
+    user_id = meter_cache.get(meter_id)
+    if user_id is None:
+        row = db.session.query(User.id).filter_by(meter_id=meter_id).first()
+        user_id = row.id if row else False
+        meter_cache.set(meter_id, user_id)
+    return user_id or None
+
+def get_ingest_spool():
+    """This process's ingest spool; its flusher thread starts on first use"""
+    global _ingest_spool
+    with _ingest_spool_lock:
+        # A forked worker must not share its parent's mapped segment
+        if _ingest_spool is None or _ingest_spool[0] != os.getpid():
+            spool = IngestSpool(
+                app.config['SPOOL_DIR'],
+                records_per_segment=app.config['SPOOL_SEGMENT_RECORDS'],
+                fsync_every=app.config['SPOOL_FSYNC_EVERY'],
+                fsync_interval=app.config['SPOOL_FSYNC_INTERVAL']
+            )
+            flusher = SpoolFlusher(spool, flush_spooled_readings, interval=app.config['SPOOL_FLUSH_INTERVAL'])
+            flusher.start()
+            atexit.register(spool.close)
+            _ingest_spool = (os.getpid(), spool, flusher)
+        return _ingest_spool[1]
+
+@app.before_request
+def start_ingest_spool():
+    """Start the flusher early so recovered segments drain without new readings"""
+    if app.config['INGEST_MODE'] == 'spool':
+        get_ingest_spool()
+
+def spool_iot_reading(meter_id, consumption_kwh, ts, token):
+    """Append a meter reading to the spool and acknowledge it (202)"""
+    try:
+        consumption_kwh = float(consumption_kwh)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'consumption_kwh must be a number'}), 400
+    # NaN and infinity would be acknowledged now but could never be stored
+    if not math.isfinite(consumption_kwh):
+        return jsonify({'error': 'consumption_kwh must be a finite number'}), 400
+
+    timestamp = reading_timestamp(ts)
+
+    try:
+        user_id = meter_user_id(meter_id)
+    except SQLAlchemyError:
+        # Database unavailable: accept now, the meter is resolved when flushing
+        db.session.rollback()
+    else:
+        if user_id is None:
+            return jsonify({'error': 'Unknown meter_id'}), 404
+        if token is not None and token['user_id'] != user_id:
+            return jsonify({'error': 'Token is not valid for this meter'}), 403
+
+    try:
+        get_ingest_spool().append(meter_id, consumption_kwh, timestamp)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({'success': True, 'message': 'Data accepted'}), 202
+
+def flush_spooled_readings(records):
+    """Bulk-insert one spool segment into consumption_records in a single transaction"""
+    with app.app_context():
+        meter_ids = list({meter_id for meter_id, _, _ in records})
+        owners = {}
+        for i in range(0, len(meter_ids), 500):
+            owners.update(db.session.query(User.meter_id, User.id).filter(
+                User.meter_id.in_(meter_ids[i:i + 500])).all())
+
+        rows = [{
+            'user_id': owners[meter_id],
+            'consumption_kwh': consumption_kwh,
+            'timestamp': timestamp,
+            'date': timestamp.date()
+        } for meter_id, consumption_kwh, timestamp in records
+            if meter_id in owners and math.isfinite(consumption_kwh)]
+        if len(rows) < len(records):
+            app.logger.warning('Dropped %d spooled readings for unknown meters or non-finite values',
+                               len(records) - len(rows))
+
+        batch = app.config['SPOOL_FLUSH_BATCH']
+        try:
+            for i in range(0, len(rows), batch):
+                db.session.execute(insert(ConsumptionRecord), rows[i:i + batch])
+            db.session.commit()
+        except (IntegrityError, DataError) as exc:
+            # The rows themselves are rejected, so retrying the segment cannot succeed
+            db.session.rollback()
+            raise BadSegmentError(str(exc)) from exc
+        except Exception:
+            db.session.rollback()
+            raise
+
+        # Same HIGH_CONSUMPTION rule as direct ingest, once per user for their
+        # largest reading. The readings are stored, so a failure here must not
+        # make the segment replay.
+        peaks = {}
+        for row in rows:
+            peaks[row['user_id']] = max(peaks.get(row['user_id'], row['consumption_kwh']), row['consumption_kwh'])
+        try:
+            check_consumption_anomalies(peaks)
+        except SQLAlchemyError:
+            db.session.rollback()
+            app.logger.exception('High consumption check failed after a spool flush')
+
+# ==================== CLI COMMANDS ====================
+
+@app.cli.command('retrain-models')
+@click.option('--workers', type=int, default=None, help='Worker processes (default: all available cores)')
+@click.option('--user', 'user_ids', type=int, multiple=True, help='Only retrain these user ids')
+def retrain_models_command(workers, user_ids):
+    """Retrain per-user forecasting models on a process pool"""
+    from utils.training import TrainingScheduler
+
+    start_date = datetime.utcnow().date() - timedelta(days=app.config['TRAINING_HISTORY_DAYS'])
+
+    # One grouped query for every user's daily series and last activity
+    query = db.session.query(
+        ConsumptionRecord.user_id,
+        ConsumptionRecord.date,
+        db.func.sum(ConsumptionRecord.consumption_kwh).label('total'),
+        db.func.max(ConsumptionRecord.timestamp).label('last_seen')
+    ).filter(ConsumptionRecord.date >= start_date)
+    if user_ids:
+        query = query.filter(ConsumptionRecord.user_id.in_(user_ids))
+    rows = query.group_by(ConsumptionRecord.user_id, ConsumptionRecord.date).order_by(
+        ConsumptionRecord.user_id, ConsumptionRecord.date).all()
+
+    series, ordinals, last_active = {}, {}, {}
+    for row in rows:
+        series.setdefault(row.user_id, []).append(float(row.total))
+        ordinals.setdefault(row.user_id, []).append(row.date.toordinal())
+        if row.last_seen and (row.user_id not in last_active or row.last_seen > last_active[row.user_id]):
+            last_active[row.user_id] = row.last_seen
+
+    def report(job, progress):
+        finished = progress['done'] + progress['failed'] + progress['cancelled']
+        click.echo(f"[{finished}/{progress['total']}] user {job.key}: {job.status}")
+
+    scheduler = TrainingScheduler(max_workers=workers or app.config['TRAINING_MAX_WORKERS'] or None,
+                                  on_progress=report)
+    for user_id, values in series.items():
+        if len(values) >= 5:
+            scheduler.submit(user_id, values, last_active.get(user_id))
+
+    # run() cancels outstanding jobs and frees their shared memory if interrupted
+    results, progress = scheduler.run()
+
+    # Store full horizon paths, as generate does, so stored forecasts stay complete
+    tomorrow = datetime.utcnow().date() + timedelta(days=1)
+    horizon = max(app.config['FORECAST_HORIZONS'])
+    for user_id, predictions in results.items():
+        models, paths = forecast_paths(predictions, ordinals[user_id], series[user_id],
+                                       tomorrow.toordinal(), horizon)
+        save_predictions(user_id, dict(zip(models, np.round(paths, 3).tolist())), tomorrow)
+    db.session.commit()
+
+    click.echo(f"Retrained {progress['done']} users ({progress['failed']} failed) in {progress['elapsed']}s")
+
+@app.cli.command('upgrade-db')
+def upgrade_db_command():
+    """Add tables, indexes and constraints missing from an existing database"""
+    db.create_all()
+    
+    # Duplicates from before the unique constraint would block it; keep the newest row
+    newest = db.session.query(db.func.max(Prediction.id)).group_by(
+        Prediction.user_id, Prediction.model_type, Prediction.prediction_date)
+    removed = Prediction.query.filter(Prediction.id.not_in(newest)).delete(synchronize_session=False)
+    db.session.commit()
+    if removed:
+        click.echo(f'Removed {removed} duplicate predictions')
+    
+    # create_all() skips tables that already exist, along with their new columns and indexes
+    inspector = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        columns = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in columns and column.server_default is not None:
+                default = column.server_default.arg.compile(dialect=db.engine.dialect)
+                db.session.execute(db.text(
+                    f'ALTER TABLE {table.name} ADD COLUMN {column.name} '
+                    f'{column.type.compile(dialect=db.engine.dialect)} NOT NULL DEFAULT {default}'))
+                db.session.commit()
+                click.echo(f'Added column {table.name}.{column.name}')
+        
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        existing.update(constraint['name'] for constraint in inspector.get_unique_constraints(table.name))
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(db.engine)
+                click.echo(f'Created index {index.name}')
+        for constraint in table.constraints:
+            if isinstance(constraint, db.UniqueConstraint) and constraint.name and constraint.name not in existing:
+                # A unique index enforces the same rule and can be added to a live table
+                columns = ', '.join(column.name for column in constraint.columns)
+                db.session.execute(db.text(f'CREATE UNIQUE INDEX {constraint.name} ON {table.name} ({columns})'))
+                db.session.commit()
+                click.echo(f'Created unique index {constraint.name}')
+
+@app.cli.command('grant-admin')
+@click.argument('username')
+@click.option('--revoke', is_flag=True, help='Remove fleet operator access instead')
+def grant_admin_command(username, revoke):
+    """Give a user access to the fleet analytics API"""
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        raise click.ClickException(f'No such user: {username}')
+    user.is_admin = not revoke
+    db.session.commit()
+    click.echo(f"{'Revoked' if revoke else 'Granted'} fleet operator access for {username}")
+
+@app.cli.command('scan-anomalies')
+def scan_anomalies_command():
+    """Scan every user's recent readings for anomalies and raise alerts"""
+    counts = scan_fleet_anomalies()
+    total = sum(counts.values())
+    click.echo(f"Raised {total} alerts" + (': ' + ', '.join(f'{k}={v}' for k, v in counts.items()) if counts else ''))
+
+# ==================== RESPONSE HANDLING ====================
+
+static_fingerprints = StaticFingerprints(app.static_folder)
+
+@app.template_global()
+def static_url(filename):
+    """Static file URL with a content fingerprint so it can be cached for a year"""
+    fingerprint = static_fingerprints.get(filename)
+    if fingerprint is None:
+        return url_for('static', filename=filename)
+    return url_for('static', filename=filename, v=fingerprint)
+
+@app.after_request
+def optimize_response(response):
+    """Add cache headers, then compress the body"""
+    if request.endpoint == 'static':
+        if request.args.get('v'):
+            response.headers['Cache-Control'] = f"public, max-age={app.config['STATIC_MAX_AGE']}, immutable"
+        else:
+            response.headers['Cache-Control'] = 'public, no-cache'
+    elif request.method == 'GET' and response.status_code == 200 and response.mimetype == 'text/html':
+        # Pages are per user; revalidate with an ETag so reloads can be 304s
+        response.headers['Cache-Control'] = 'private, no-cache'
+        response.add_etag()
+        response.make_conditional(request)
+    
+    return compress_response(
+        response,
+        request.accept_encodings,
+        min_size=app.config['COMPRESS_MIN_SIZE'],
+        mimetypes=app.config['COMPRESS_MIMETYPES'],
+        gzip_level=app.config['COMPRESS_LEVEL'],
+        brotli_quality=app.config['COMPRESS_BROTLI_QUALITY']
+    )
+
+@app.cli.command('flush-spool')
+def flush_spool_command():
+    """Drain sealed ingest spool segments into the database"""
+    spool = IngestSpool(app.config['SPOOL_DIR'])
+    stored = SpoolFlusher(spool, flush_spooled_readings).drain()
+    click.echo(f'Flushed {stored} spooled readings')
+
 # ==================== ERROR HANDLERS ====================
 
 @app.errorhandler(404)
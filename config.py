@@ -14,10 +14,28 @@ class Config:
     SESSION_COOKIE_SECURE = False  # Set to True in production with HTTPS
     SESSION_COOKIE_HTTPONLY = True
     SESSION_COOKIE_SAMESITE = 'Lax'
+    SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'cookie')  # cookie, memory or filesystem
+    SESSION_FILE_DIR = os.environ.get('SESSION_FILE_DIR', 'flask_session')
+    
+    # API tokens
+    API_TOKEN_RATE_LIMIT = int(os.environ.get('API_TOKEN_RATE_LIMIT', 120))  # Requests per minute per token
+    API_TOKEN_CACHE_TTL = 60  # seconds
+    API_TOKEN_CACHE_SIZE = 10000
+    IOT_REQUIRE_TOKEN = os.environ.get('IOT_REQUIRE_TOKEN', 'False').lower() in ('1', 'true', 'yes')
     
     # Database
     SQLALCHEMY_DATABASE_URI = 'sqlite:///smartwatt_nexus.db'
     
+    # Ingest: 'direct' commits each reading; 'spool' appends to a local log
+    # that is flushed to the database in bulk
+    INGEST_MODE = os.environ.get('INGEST_MODE', 'direct')
+    SPOOL_DIR = os.environ.get('SPOOL_DIR', 'spool')
+    SPOOL_SEGMENT_RECORDS = 65536
+    SPOOL_FSYNC_EVERY = 256  # records
+    SPOOL_FSYNC_INTERVAL = 0.5  # seconds
+    SPOOL_FLUSH_INTERVAL = 2.0  # seconds
+    SPOOL_FLUSH_BATCH = 5000
+    
     # ML Models
     LSTM_EPOCHS = 50
     LSTM_BATCH_SIZE = 16
@@ -26,6 +44,13 @@ class Config:
     ANN_EPOCHS = 100
     ANN_BATCH_SIZE = 16
     
+    # Parallel training (0 = use all available cores)
+    TRAINING_MAX_WORKERS = int(os.environ.get('TRAINING_MAX_WORKERS', 0))
+    TRAINING_HISTORY_DAYS = 30
+    
+    # Horizon forecasts (days ahead)
+    FORECAST_HORIZONS = (7, 30)
+    
     # TS Electric Department Rates
     TARIFF_SLABS = [
         {'from': 0, 'to': 50, 'rate': 2.80},
@@ -42,12 +67,33 @@ class Config:
     HIGH_CONSUMPTION_THRESHOLD = 1.3  # 30% above average
     ANOMALY_SENSITIVITY = 1.5  # Standard deviations
     
+    # Batch anomaly scanner
+    ANOMALY_SCAN_DAYS = 14
+    ANOMALY_DEDUP_HOURS = 24
+    FLATLINE_HOURS = 6  # Identical hourly values before a meter is considered stuck
+    DATA_GAP_HOURS = 6
+    DATA_GAP_INTERVALS = 3  # Gap must also span this many of the meter's median reporting intervals
+    NIGHT_BASELOAD_RATIO = 1.5
+    
+    # Fleet analytics (operators are users flagged with `flask grant-admin`)
+    FLEET_MAX_DAYS = 366
+    FLEET_CACHE_TTL = {'hour': 300, 'day': 3600}  # seconds
+    
     # API Configuration
     JSON_SORT_KEYS = False
-    JSONIFY_PRETTYPRINT_REGULAR = True
+    JSONIFY_PRETTYPRINT_REGULAR = False  # JSON is compact (see utils.http.FastJSONProvider)
+    
+    # Response compression and static asset caching
+    COMPRESS_MIN_SIZE = 500  # bytes
+    COMPRESS_LEVEL = 6  # gzip
+    COMPRESS_BROTLI_QUALITY = 5
+    # Buffered responses only; static files are streamed as-is and left to the proxy
+    COMPRESS_MIMETYPES = ['application/json', 'text/html', 'text/csv', 'text/plain']
+    STATIC_MAX_AGE = 31536000  # One year for fingerprinted (?v=) static URLs
     
     # Pagination
     ITEMS_PER_PAGE = 50
+    MAX_ITEMS_PER_PAGE = 500
 
 class DevelopmentConfig(Config):
     """Development configuration"""
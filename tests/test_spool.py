@@ -0,0 +1,157 @@
+"""
+Tests for the append-only ingest spool
+"""
+import os
+import threading
+import time
+from datetime import datetime
+
+from utils.spool import BadSegmentError, IngestSpool, SpoolFlusher, read_segment
+
+
+class Collector:
+    """flush_fn that records every flushed reading"""
+
+    def __init__(self):
+        self.records = []
+        self._lock = threading.Lock()
+
+    def __call__(self, records):
+        with self._lock:
+            self.records.extend(records)
+
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+def test_append_round_trip(tmp_path):
+    spool = IngestSpool(str(tmp_path), records_per_segment=4)
+    timestamp = datetime(2026, 2, 21, 12, 30)
+    for i in range(6):
+        spool.append(f'METER{i}', i * 0.5, timestamp)
+    spool.close()
+
+    records = []
+    for path in spool.ready_segments():
+        records.extend(read_segment(path))
+    assert records == [(f'METER{i}', i * 0.5, timestamp) for i in range(6)]
+
+
+def test_recover_leaves_active_segment_alone(tmp_path):
+    spool = IngestSpool(str(tmp_path), records_per_segment=100)
+    spool.append('METER1', 1.0, datetime(2026, 2, 21))
+    spool.recover()
+    spool.append('METER1', 2.0, datetime(2026, 2, 21))
+
+    assert spool.ready_segments() == []
+    spool.close()
+    (path,) = spool.ready_segments()
+    assert [r[1] for r in read_segment(path)] == [1.0, 2.0]
+
+
+def test_recover_picks_up_stale_segment_of_same_pid(tmp_path):
+    # Unsealed segment left by an earlier process that had our pid
+    old = IngestSpool(str(tmp_path), records_per_segment=100)
+    old.append('METER1', 1.0, datetime(2026, 2, 21))
+    old._segment.sync()
+
+    spool = IngestSpool(str(tmp_path), records_per_segment=100)
+    (path,) = spool.ready_segments()
+    assert [r[1] for r in read_segment(path)] == [1.0]
+
+
+def test_concurrent_append_with_flusher(tmp_path):
+    spool = IngestSpool(str(tmp_path), records_per_segment=37, fsync_every=10)
+    collector = Collector()
+    flusher = SpoolFlusher(spool, collector, interval=0.005)
+    flusher.start()
+
+    stop = threading.Event()
+
+    def recover_loop():
+        while not stop.is_set():
+            spool.recover()
+
+    errors = []
+    threads, per_thread = 4, 500
+    timestamp = datetime(2026, 2, 21, 12, 0)
+
+    def writer(n):
+        try:
+            for i in range(per_thread):
+                spool.append(f'METER{n}', float(i), timestamp)
+        except Exception as exc:
+            errors.append(exc)
+
+    recoverer = threading.Thread(target=recover_loop)
+    recoverer.start()
+    writers = [threading.Thread(target=writer, args=(n,)) for n in range(threads)]
+    for thread in writers:
+        thread.start()
+    for thread in writers:
+        thread.join()
+    stop.set()
+    recoverer.join()
+
+    spool.close()
+    assert wait_for(lambda: len(collector.records) >= threads * per_thread)
+    flusher.stop()
+
+    assert errors == []
+    assert sorted((r[0], r[1]) for r in collector.records) == sorted(
+        (f'METER{n}', float(i)) for n in range(threads) for i in range(per_thread))
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_drain_sets_aside_bad_segment(tmp_path):
+    spool = IngestSpool(str(tmp_path), records_per_segment=1)
+    collector = Collector()
+
+    def flush(records):
+        if records[0][0] == 'BAD':
+            raise BadSegmentError('rejected by the database')
+        collector(records)
+
+    spool.append('BAD', 1.0, datetime(2026, 2, 21))
+    spool.append('METER1', 2.0, datetime(2026, 2, 21))
+    assert SpoolFlusher(spool, flush).drain() == 1
+
+    assert [r[0] for r in collector.records] == ['METER1']
+    assert spool.ready_segments() == []
+    assert [name.rsplit('.', 1)[1] for name in os.listdir(str(tmp_path))] == ['bad']
+
+
+def test_flusher_survives_errors(tmp_path):
+    spool = IngestSpool(str(tmp_path), records_per_segment=1)
+    collector = Collector()
+    flusher = SpoolFlusher(spool, collector, interval=0.005, max_backoff=0.01)
+
+    failures = {'recover': 1, 'flush': 1}
+    recover = spool.recover
+
+    def flaky_recover():
+        if failures['recover']:
+            failures['recover'] -= 1
+            raise OSError('spool directory unavailable')
+        recover()
+
+    def flaky_flush(records):
+        if failures['flush']:
+            failures['flush'] -= 1
+            raise RuntimeError('database unavailable')
+        collector(records)
+
+    spool.recover = flaky_recover
+    flusher.flush_fn = flaky_flush
+    spool.append('METER1', 1.0, datetime(2026, 2, 21))
+    flusher.start()
+
+    assert wait_for(lambda: len(collector.records) == 1)
+    flusher.stop()
+    assert failures == {'recover': 0, 'flush': 0}
@@ -0,0 +1,116 @@
+"""
+Vectorized anomaly detectors for fleet-wide batch scans
+
+Every detector works on a (users x time) matrix at once and returns a boolean
+mask of flagged users plus the value that triggered the flag. Hours without
+any reading are NaN in the hourly matrix.
+"""
+import warnings
+
+import numpy as np
+
+NIGHT_HOURS = slice(0, 6)  # 00:00-05:59
+MAD_SCALE = 0.6745
+
+
+def _run_lengths(mask):
+    """Length of the run of True ending at each position along axis 1"""
+    idx = np.arange(mask.shape[1])
+    last_break = np.maximum.accumulate(np.where(mask, -1, idx), axis=1)
+    return idx - last_break
+
+
+def daily_matrix(hourly, days):
+    """Daily totals from the first ``days * 24`` columns; NaN for empty days"""
+    by_day = hourly[:, :days * 24].reshape(hourly.shape[0], days, 24)
+    totals = np.nansum(by_day, axis=2)
+    totals[np.isnan(by_day).all(axis=2)] = np.nan
+    return totals
+
+
+def rolling_zscore(daily, recent=3, threshold=1.5):
+    """Sustained drift: mean of the last ``recent`` days against the z-score of
+    the preceding baseline days."""
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        baseline = daily[:, :-recent]
+        mean = np.nanmean(baseline, axis=1)
+        std = np.nanstd(baseline, axis=1)
+        current = np.nanmean(daily[:, -recent:], axis=1)
+        z = (current - mean) / std
+    flagged = np.isfinite(z) & (std > 0) & (z > threshold)
+    return flagged, current, z
+
+
+def mad_outliers(daily, threshold=3.5):
+    """Spike on the latest day, scored by median absolute deviation"""
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        history = daily[:, :-1]
+        median = np.nanmedian(history, axis=1)
+        mad = np.nanmedian(np.abs(history - median[:, None]), axis=1)
+        latest = daily[:, -1]
+        score = MAD_SCALE * (latest - median) / mad
+    flagged = np.isfinite(score) & (mad > 0) & (score > threshold)
+    return flagged, latest, score
+
+
+def flatline(hourly, min_hours=6, recent=None):
+    """Stuck meter: the same non-zero hourly value repeated for ``min_hours``.
+
+    With ``recent``, only runs still going in the last ``recent`` hours count,
+    so a stuck spell is not reported again once it is over.
+    """
+    rows = np.arange(hourly.shape[0])
+    if hourly.shape[1] < 2:
+        return np.zeros(rows.size, dtype=bool), np.full(rows.size, np.nan), np.ones(rows.size, dtype=np.int64)
+    with np.errstate(invalid='ignore'):
+        same = (hourly[:, 1:] == hourly[:, :-1]) & (hourly[:, 1:] != 0)
+    runs = _run_lengths(same)
+    first = max(runs.shape[1] - recent, 0) if recent else 0
+    end = first + runs[:, first:].argmax(axis=1)
+    longest = runs[rows, end] + 1
+    return longest >= min_hours, hourly[rows, end + 1], longest
+
+
+def reporting_interval(hourly):
+    """Median hours between consecutive readings of each meter (NaN if unknown)"""
+    present = ~np.isnan(hourly)
+    started = np.logical_or.accumulate(present, axis=1)
+    gaps = _run_lengths(started & ~present)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        intervals = np.where(present[:, 1:] & started[:, :-1], gaps[:, :-1] + 1.0, np.nan)
+        return np.nanmedian(intervals, axis=1) if intervals.shape[1] else np.full(hourly.shape[0], np.nan)
+
+
+def data_gaps(hourly, min_hours=6, recent=None, interval_factor=3.0):
+    """Longest stretch of hours without readings after a meter's first reading.
+
+    A gap must last ``min_hours`` and span ``interval_factor`` of the meter's
+    own median reporting interval, so meters that report every few hours are
+    not flagged between readings. With ``recent``, only gaps reaching into the
+    last ``recent`` hours count.
+    """
+    present = ~np.isnan(hourly)
+    started = np.logical_or.accumulate(present, axis=1)
+    if hourly.shape[1] == 0:
+        gaps = np.zeros(hourly.shape[0], dtype=np.int64)
+    else:
+        first = max(hourly.shape[1] - recent, 0) if recent else 0
+        gaps = _run_lengths(started & ~present)[:, first:].max(axis=1)
+    interval = np.nan_to_num(reporting_interval(hourly), nan=1.0)
+    return (gaps >= min_hours) & (gaps + 1 >= interval * interval_factor), gaps
+
+
+def night_baseload(hourly, days, ratio=1.5, min_increase=0.1):
+    """Jump in the latest night's mean hourly load against previous nights"""
+    nights = hourly[:, :days * 24].reshape(hourly.shape[0], days, 24)[:, :, NIGHT_HOURS]
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        per_night = np.nanmean(nights, axis=2)
+        baseline = np.nanmedian(per_night[:, :-1], axis=1)
+        latest = per_night[:, -1]
+    flagged = (np.isfinite(latest) & np.isfinite(baseline) & (baseline > 0)
+               & (latest > baseline * ratio) & (latest - baseline > min_increase))
+    return flagged, latest, baseline
@@ -0,0 +1,61 @@
+"""
+Multi-step horizon forecasting
+
+The ML models produce a next-day value. These helpers stretch that value over
+a multi-day horizon using the recent trend and weekday pattern of the user's
+daily totals, for every model in a single vectorized pass.
+"""
+import numpy as np
+
+# Keep long horizons from running away on a short, noisy trend
+MAX_TREND_RATIO = 2.0
+MIN_TREND_RATIO = 0.5
+
+
+def _weekdays(ordinals):
+    """Weekday (Monday=0) of proleptic Gregorian ordinals"""
+    return (ordinals - 1) % 7
+
+
+def horizon_shape(ordinals, values, start, horizon):
+    """Relative profile of ``horizon`` days from ordinal ``start``, normalised so
+    the first day is 1.0.
+
+    ``ordinals`` are ``date.toordinal()`` values of the observed days and
+    ``values`` their consumption; days without data may simply be absent.
+    """
+    ordinals = np.asarray(ordinals, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    future = start + np.arange(horizon)
+    shape = np.ones(horizon)
+
+    if values.size >= 3 and np.ptp(ordinals) > 0:
+        slope, intercept = np.polyfit(ordinals - ordinals[-1], values, 1)
+        trend = intercept + slope * (future - ordinals[-1])
+        if trend[0] > 0:
+            shape *= np.clip(trend / trend[0], MIN_TREND_RATIO, MAX_TREND_RATIO)
+
+    # Weekday factors need at least two weeks to be meaningful
+    level = values.mean() if values.size else 0.0
+    if level > 0 and np.ptp(ordinals) >= 13:
+        weekdays = _weekdays(ordinals)
+        sums = np.bincount(weekdays, weights=values, minlength=7)
+        counts = np.bincount(weekdays, minlength=7)
+        factors = np.divide(sums, counts * level, out=np.ones(7), where=counts > 0)
+        seasonal = factors[_weekdays(future)]
+        if seasonal[0] > 0:
+            shape *= seasonal / seasonal[0]
+
+    return shape
+
+
+def forecast_paths(next_day, ordinals, values, start, horizon):
+    """Daily forecasts for every model over ``horizon`` days from ``start``.
+
+    ``next_day`` maps model type to its next-day prediction. Returns the model
+    types and a (models x horizon) array of non-negative daily forecasts.
+    """
+    models = list(next_day)
+    base = np.array([next_day[m] for m in models], dtype=np.float64)
+    paths = np.outer(base, horizon_shape(ordinals, values, start, horizon))
+    return models, np.clip(paths, 0, None)
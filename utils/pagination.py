@@ -0,0 +1,74 @@
+"""
+Keyset (cursor) pagination and field projection helpers for list APIs
+
+A cursor encodes the (sort key, id) of the last row on a page, so fetching
+the next page is an indexed range scan no matter how deep the client scrolls.
+"""
+import base64
+import json
+
+from sqlalchemy import and_, or_
+
+
+def encode_cursor(sort_value, row_id):
+    """Opaque cursor for the row after which the next page starts"""
+    raw = json.dumps([sort_value.isoformat(), row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, parse_key):
+    """Inverse of encode_cursor; raises ValueError for malformed cursors"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return parse_key(sort_value), int(row_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
+def page_size(requested, default, maximum):
+    """Clamp a requested page size to 1..maximum"""
+    if requested is None:
+        return default
+    return max(1, min(requested, maximum))
+
+
+def parse_fields(raw, allowed):
+    """Validate a comma-separated ``fields=`` list; all fields when empty"""
+    if not raw:
+        return list(allowed)
+    fields = [f.strip() for f in raw.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+def keyset_page(query, sort_column, id_column, after, limit, descending=True):
+    """Fetch one page ordered by (sort_column, id_column).
+
+    ``after`` is a decoded cursor ``(sort_value, id)`` or None for the first
+    page. Returns the rows and the ``(sort_value, id)`` key of the last row, or
+    None when there are no more pages. The query must select both key columns.
+    """
+    if after is not None:
+        sort_value, row_id = after
+        if descending:
+            query = query.filter(or_(sort_column < sort_value,
+                                     and_(sort_column == sort_value, id_column < row_id)))
+        else:
+            query = query.filter(or_(sort_column > sort_value,
+                                     and_(sort_column == sort_value, id_column > row_id)))
+
+    if descending:
+        query = query.order_by(sort_column.desc(), id_column.desc())
+    else:
+        query = query.order_by(sort_column, id_column)
+
+    # One extra row tells us whether another page exists
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, (getattr(last, sort_column.key), getattr(last, id_column.key))
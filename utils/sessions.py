@@ -0,0 +1,167 @@
+"""
+Optional server-side session store
+
+The cookie carries only a signed session id; session data lives in a local
+in-memory or file backend. The memory backend is per process, so use the
+filesystem backend when running several gunicorn workers on one host.
+"""
+import json
+import os
+import re
+import secrets
+import tempfile
+import time
+
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import BadSignature, Signer
+from werkzeug.datastructures import CallbackDict
+
+from utils.cache import TTLCache
+
+_SID_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    """Session dict that remembers its id and whether it changed"""
+
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+        CallbackDict.__init__(self, initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        self.old_sid = None
+
+    def regenerate(self):
+        """Move the data to a fresh session id, e.g. on login"""
+        if self.old_sid is None:
+            self.old_sid = self.sid
+        self.sid = secrets.token_hex(32)
+        self.modified = True
+
+
+class MemorySessionStore:
+    """Per-process session store"""
+
+    def __init__(self, maxsize=100000):
+        self._cache = TTLCache(maxsize=maxsize)
+
+    def get(self, sid):
+        return self._cache.get(sid)
+
+    def set(self, sid, data, ttl):
+        self._cache.set(sid, data, ttl=ttl)
+
+    def delete(self, sid):
+        self._cache.pop(sid)
+
+
+class FileSessionStore:
+    """One JSON file per session, shared by all processes on the host"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, sid):
+        return os.path.join(self.directory, sid + '.json')
+
+    def get(self, sid):
+        try:
+            with open(self._path(sid), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get('expires', 0) <= time.time():
+            self.delete(sid)
+            return None
+        return entry.get('data')
+
+    def set(self, sid, data, ttl):
+        entry = {'expires': time.time() + ttl, 'data': data}
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, self._path(sid))
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def delete(self, sid):
+        try:
+            os.unlink(self._path(sid))
+        except OSError:
+            pass
+
+
+class ServerSideSessionInterface(SessionInterface):
+    """Flask session interface backed by a MemorySessionStore or FileSessionStore"""
+
+    salt = 'smartwatt-session'
+
+    def __init__(self, store):
+        self.store = store
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt=self.salt)
+
+    def open_session(self, app, request):
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if cookie:
+            try:
+                sid = self._signer(app).unsign(cookie).decode('ascii')
+            except BadSignature:
+                sid = None
+            if sid and _SID_PATTERN.match(sid):
+                data = self.store.get(sid)
+                if data is not None:
+                    return ServerSideSession(data, sid=sid)
+        return ServerSideSession(sid=secrets.token_hex(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        # The old id must stop working once the data has moved to a new one
+        if session.old_sid is not None:
+            self.store.delete(session.old_sid)
+
+        if not session:
+            if session.modified:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if not self.should_set_cookie(app, session):
+            return
+
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        self.store.set(session.sid, dict(session), lifetime)
+        response.set_cookie(
+            name,
+            self._signer(app).sign(session.sid.encode('ascii')).decode('ascii'),
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app)
+        )
+
+
+def create_session_interface(backend, directory=None):
+    """Session interface for SESSION_BACKEND, or None to keep cookie sessions"""
+    if not backend or backend == 'cookie':
+        return None
+    if backend == 'memory':
+        return ServerSideSessionInterface(MemorySessionStore())
+    if backend == 'filesystem':
+        return ServerSideSessionInterface(FileSessionStore(directory or 'flask_session'))
+    raise ValueError(f'Unknown SESSION_BACKEND: {backend}')
@@ -0,0 +1,313 @@
+"""
+Append-only local spool for meter readings
+
+Readings are appended to fixed-size binary records in memory-mapped segment
+files and acknowledged straight away; a flusher later drains whole segments
+into the database in bulk. Segment files move through these states:
+
+    <created>-<pid>-<seq>.open            being appended to by process <pid>
+    <created>-<pid>-<seq>.ready           sealed, waiting to be flushed
+    <created>-<pid>-<seq>.flushing.<pid>  claimed by a flusher in <pid>
+    <created>-<pid>-<seq>.bad             unreadable, kept for inspection
+
+Claiming is an atomic rename, so several worker processes can share one spool
+directory. Segments left behind by dead processes are recovered on startup.
+Delivery is at-least-once: a crash between the database commit and deleting
+the segment replays that segment.
+"""
+import glob
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'SWSPOOL1'
+HEADER = struct.Struct('<8sII')  # magic, record size, capacity
+RECORD = struct.Struct('<50sdd')  # meter_id, consumption_kwh, timestamp (UTC epoch seconds)
+CRC = struct.Struct('<I')
+RECORD_SIZE = RECORD.size + CRC.size
+
+EPOCH = datetime(1970, 1, 1)
+
+
+class BadSegmentError(Exception):
+    """Raised by a flush function when a segment's records can never be stored"""
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _owner_pid(path):
+    """Pid of the process that created or claimed a segment file"""
+    name = os.path.basename(path)
+    if '.flushing.' in name:
+        return int(name.rsplit('.', 1)[1])
+    return int(name.split('-')[1])
+
+
+def _base_path(path):
+    """Segment path without its state suffix"""
+    directory, name = os.path.split(path)
+    return os.path.join(directory, name.split('.', 1)[0])
+
+
+def pack_record(meter_id, consumption_kwh, timestamp):
+    """Fixed-size binary record with a trailing CRC32"""
+    meter = meter_id.encode('utf-8')
+    if len(meter) > 50:
+        raise ValueError('meter_id is longer than 50 bytes')
+    body = RECORD.pack(meter, float(consumption_kwh), (timestamp - EPOCH).total_seconds())
+    return body + CRC.pack(zlib.crc32(body))
+
+
+def read_segment(path):
+    """Valid records of a segment as (meter_id, consumption_kwh, timestamp).
+
+    Reading stops at the first empty or torn record, which is where an
+    interrupted writer left off.
+    """
+    records = []
+    with open(path, 'rb') as f:
+        magic, record_size, capacity = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC or record_size != RECORD_SIZE:
+            raise ValueError(f'Not a spool segment: {path}')
+        data = f.read(record_size * capacity)
+
+    for offset in range(0, len(data) - RECORD_SIZE + 1, RECORD_SIZE):
+        body = data[offset:offset + RECORD.size]
+        (crc,) = CRC.unpack_from(data, offset + RECORD.size)
+        if crc != zlib.crc32(body) or not body.strip(b'\x00'):
+            break
+        meter, consumption_kwh, seconds = RECORD.unpack(body)
+        records.append((meter.rstrip(b'\x00').decode('utf-8'), consumption_kwh,
+                        EPOCH + timedelta(seconds=seconds)))
+    return records
+
+
+class _Segment:
+    """Preallocated, memory-mapped segment being appended to"""
+
+    def __init__(self, path, capacity):
+        self.path = path
+        self.capacity = capacity
+        self.count = 0
+        self.created = time.monotonic()
+        self._file = open(path, 'w+b')
+        self._file.truncate(HEADER.size + RECORD_SIZE * capacity)
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        self._map[:HEADER.size] = HEADER.pack(MAGIC, RECORD_SIZE, capacity)
+
+    @property
+    def full(self):
+        return self.count >= self.capacity
+
+    def append(self, record):
+        offset = HEADER.size + self.count * RECORD_SIZE
+        self._map[offset:offset + RECORD_SIZE] = record
+        self.count += 1
+
+    def sync(self):
+        self._map.flush()
+
+    def close(self):
+        self._map.flush()
+        self._map.close()
+        os.fsync(self._file.fileno())
+        self._file.close()
+
+
+class IngestSpool:
+    """Append-only spool of meter readings in a local directory"""
+
+    def __init__(self, directory, records_per_segment=65536, fsync_every=256, fsync_interval=1.0):
+        self.directory = directory
+        self.records_per_segment = records_per_segment
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+
+        self._lock = threading.Lock()
+        self._segment = None
+        self._seq = 0
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+        os.makedirs(directory, exist_ok=True)
+        self.recover()
+
+    def append(self, meter_id, consumption_kwh, timestamp):
+        """Durably queue one reading (synced in batches)"""
+        record = pack_record(meter_id, consumption_kwh, timestamp)
+        with self._lock:
+            if self._segment is None:
+                self._segment = self._new_segment()
+            self._segment.append(record)
+            self._unsynced += 1
+
+            now = time.monotonic()
+            if self._segment.full:
+                self._seal()
+            elif self._unsynced >= self.fsync_every or now - self._last_sync >= self.fsync_interval:
+                self._segment.sync()
+                self._unsynced = 0
+                self._last_sync = now
+
+    def rotate_if_stale(self, max_age):
+        """Seal the active segment once it has held records for ``max_age`` seconds"""
+        with self._lock:
+            if (self._segment is not None and self._segment.count
+                    and time.monotonic() - self._segment.created >= max_age):
+                self._seal()
+
+    def close(self):
+        """Seal the active segment so it can be flushed"""
+        with self._lock:
+            if self._segment is not None:
+                if self._segment.count:
+                    self._seal()
+                else:
+                    self._segment.close()
+                    os.unlink(self._segment.path)
+                    self._segment = None
+
+    def ready_segments(self):
+        return sorted(glob.glob(os.path.join(self.directory, '*.ready')))
+
+    def claim(self, path):
+        """Take a ready segment for flushing; None if another flusher got it"""
+        claimed = f'{_base_path(path)}.flushing.{os.getpid()}'
+        try:
+            os.rename(path, claimed)
+        except FileNotFoundError:
+            return None
+        return claimed
+
+    def release(self, path):
+        """Return a claimed segment to the ready state after a failed flush"""
+        os.rename(path, _base_path(path) + '.ready')
+
+    def complete(self, path):
+        """Drop a segment whose records are safely in the database"""
+        os.unlink(path)
+
+    def recover(self):
+        """Make segments of dead processes flushable again"""
+        pid = os.getpid()
+        # Held throughout, so append() cannot create a segment between reading
+        # the active path and renaming our own pid's unsealed segments
+        with self._lock:
+            active = self._segment.path if self._segment is not None else None
+            for path in glob.glob(os.path.join(self.directory, '*.open')):
+                owner = _owner_pid(path)
+                # A segment under our own pid that we are not writing was left by an
+                # earlier process that happened to have the same pid
+                if path != active and (owner == pid or not _pid_alive(owner)):
+                    logger.info('Recovering unsealed spool segment %s', path)
+                    self._rename(path, _base_path(path) + '.ready')
+            for path in glob.glob(os.path.join(self.directory, '*.flushing.*')):
+                owner = _owner_pid(path)
+                if owner != pid and not _pid_alive(owner):
+                    logger.info('Recovering interrupted flush of %s', path)
+                    self._rename(path, _base_path(path) + '.ready')
+
+    @staticmethod
+    def _rename(src, dst):
+        """Rename unless another process already moved the file"""
+        try:
+            os.rename(src, dst)
+        except FileNotFoundError:
+            pass
+
+    def _new_segment(self):
+        self._seq += 1
+        name = f'{int(time.time() * 1000):013d}-{os.getpid()}-{self._seq:06d}.open'
+        return _Segment(os.path.join(self.directory, name), self.records_per_segment)
+
+    def _seal(self):
+        # Forget the segment first: if closing or renaming fails, the next
+        # append starts a new segment instead of writing to a closed map
+        segment, self._segment = self._segment, None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        segment.close()
+        os.rename(segment.path, _base_path(segment.path) + '.ready')
+
+
+class SpoolFlusher:
+    """Background thread that drains sealed segments through ``flush_fn``.
+
+    ``flush_fn`` receives the list of records of one segment and must raise
+    if they were not stored; the segment is then retried with backoff, or set
+    aside as ``.bad`` if the error is a BadSegmentError.
+    """
+
+    def __init__(self, spool, flush_fn, interval=2.0, max_backoff=30.0):
+        self.spool = spool
+        self.flush_fn = flush_fn
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='spool-flusher', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def drain(self):
+        """Flush every ready segment once; returns the number of records stored"""
+        stored = 0
+        for path in self.spool.ready_segments():
+            claimed = self.spool.claim(path)
+            if claimed is None:
+                continue
+            try:
+                records = read_segment(claimed)
+            except (OSError, ValueError, struct.error):
+                logger.exception('Skipping unreadable spool segment %s', claimed)
+                os.rename(claimed, _base_path(claimed) + '.bad')
+                continue
+            try:
+                if records:
+                    self.flush_fn(records)
+            except BadSegmentError:
+                # Retrying cannot help, and would hold back every later segment
+                logger.exception('Setting aside spool segment %s', claimed)
+                os.rename(claimed, _base_path(claimed) + '.bad')
+                continue
+            except Exception:
+                self.spool.release(claimed)
+                raise
+            self.spool.complete(claimed)
+            stored += len(records)
+        return stored
+
+    def _run(self):
+        delay = self.interval
+        while not self._stop.wait(delay):
+            try:
+                self.spool.rotate_if_stale(self.interval)
+                self.spool.recover()
+                self.drain()
+            except Exception:
+                delay = min(delay * 2, self.max_backoff)
+                logger.exception('Spool flush failed; retrying in %.0fs', delay)
+            else:
+                delay = self.interval
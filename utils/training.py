@@ -0,0 +1,240 @@
+"""
+Parallel training scheduler for per-user forecasting models
+
+Training LSTM/ANN/regression models is CPU-bound, so jobs are spread across a
+process pool instead of running inside a web worker. Each job's series is
+handed to the worker through shared memory rather than pickled as a list.
+"""
+import heapq
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from multiprocessing import shared_memory
+
+import numpy as np
+
+DEFAULT_MODEL_TYPES = ('LSTM', 'REGRESSION', 'ANN')
+
+
+def available_cores():
+    """Number of cores this process is allowed to run on"""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0)) or 1
+    return os.cpu_count() or 1
+
+
+def _load_predictors():
+    """Import ML models lazily; an empty mapping means use the mean fallback"""
+    try:
+        from utils.ml_models import LSTMPredictor, RegressionPredictor, ANNPredictor
+    except Exception:
+        return {}
+    return {'LSTM': LSTMPredictor, 'REGRESSION': RegressionPredictor, 'ANN': ANNPredictor}
+
+
+def _train_worker(shm_name, length, model_types):
+    """Train each model on the shared series and return next-step predictions"""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        series = np.ndarray((length,), dtype=np.float64, buffer=shm.buf).copy()
+    finally:
+        shm.close()
+
+    data = series.tolist()
+    fallback = float(series.mean()) if length else 0.0
+    predictors = _load_predictors()
+
+    results = {}
+    for model_type in model_types:
+        predictor = predictors.get(model_type)
+        try:
+            if hasattr(predictor, 'train'):
+                predictor.train(data)
+            results[model_type] = float(predictor.predict(data))
+        except Exception:
+            results[model_type] = fallback
+    return results
+
+
+class TrainingJob:
+    """A pending or running training job for one user (or cluster)"""
+
+    def __init__(self, key, series, last_active=None):
+        self.key = key
+        self.series = np.ascontiguousarray(series, dtype=np.float64)
+        self.last_active = last_active if last_active is not None else 0.0
+        self.status = 'pending'
+        self.result = None
+        self.error = None
+        self.shm = None
+        self.future = None
+
+    def __repr__(self):
+        return f'<TrainingJob {self.key} {self.status}>'
+
+
+class TrainingScheduler:
+    """Priority scheduler that trains per-user models on a process pool.
+
+    Jobs are ordered by last activity so recently active users are retrained
+    first. At most ``max_workers`` jobs are in flight at once, which bounds the
+    number of live shared-memory segments.
+    """
+
+    def __init__(self, max_workers=None, model_types=DEFAULT_MODEL_TYPES, on_progress=None):
+        self.max_workers = max_workers or available_cores()
+        self.model_types = tuple(model_types)
+        self.on_progress = on_progress
+
+        self._lock = threading.Lock()
+        self._heap = []
+        self._counter = itertools.count()
+        self._jobs = {}
+        self._stopped = False
+
+    def submit(self, key, series, last_active=None):
+        """Queue a job; resubmitting a pending key replaces its series"""
+        if hasattr(last_active, 'timestamp'):
+            last_active = last_active.timestamp()
+        job = TrainingJob(key, series, last_active)
+        with self._lock:
+            previous = self._jobs.get(key)
+            if previous is not None and previous.status == 'running':
+                raise ValueError(f'Job {key!r} is already running')
+            self._jobs[key] = job
+            heapq.heappush(self._heap, (-job.last_active, next(self._counter), job))
+        return job
+
+    def cancel(self, key):
+        """Cancel a job; returns False if it already finished.
+
+        A running job is dropped from the pool if no worker has picked it up
+        yet; otherwise its result is discarded when the worker returns.
+        """
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is None or job.status in ('done', 'failed', 'cancelled'):
+                return False
+            job.status = 'cancelled'
+            if job.future is not None:
+                job.future.cancel()
+            return True
+
+    def cancel_all(self):
+        """Stop dispatching and cancel every unfinished job"""
+        with self._lock:
+            self._stopped = True
+            for job in self._jobs.values():
+                if job.status in ('pending', 'running'):
+                    job.status = 'cancelled'
+                    if job.future is not None:
+                        job.future.cancel()
+
+    def progress(self):
+        """Counts of jobs per status plus the overall total"""
+        with self._lock:
+            counts = {'pending': 0, 'running': 0, 'done': 0, 'failed': 0, 'cancelled': 0}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+        counts['total'] = sum(counts.values())
+        return counts
+
+    def results(self):
+        """Predictions of every completed job keyed by job key"""
+        with self._lock:
+            return {key: job.result for key, job in self._jobs.items() if job.status == 'done'}
+
+    def run(self):
+        """Run all queued jobs to completion; returns (results, progress)"""
+        started = time.monotonic()
+        executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        in_flight = {}
+        try:
+            while True:
+                while len(in_flight) < self.max_workers:
+                    job = self._next_job()
+                    if job is None:
+                        break
+                    future = self._dispatch(executor, job)
+                    if future is not None:
+                        in_flight[future] = job
+
+                if not in_flight:
+                    break
+
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    self._complete(in_flight.pop(future), future)
+        finally:
+            # Only non-empty when interrupted (e.g. KeyboardInterrupt): cancel
+            # what has not started and free the segments of every in-flight job
+            if in_flight:
+                self.cancel_all()
+                for job in in_flight.values():
+                    self._release(job)
+            executor.shutdown(wait=not in_flight, cancel_futures=True)
+
+        progress = self.progress()
+        progress['elapsed'] = round(time.monotonic() - started, 3)
+        return self.results(), progress
+
+    def _next_job(self):
+        """Pop the highest-priority job that is still pending"""
+        with self._lock:
+            if self._stopped:
+                return None
+            while self._heap:
+                _, _, job = heapq.heappop(self._heap)
+                if job.status == 'pending' and self._jobs.get(job.key) is job:
+                    job.status = 'running'
+                    return job
+            return None
+
+    def _dispatch(self, executor, job):
+        """Copy the series into shared memory and hand it to a worker"""
+        length = job.series.size
+        try:
+            job.shm = shared_memory.SharedMemory(create=True, size=max(length, 1) * 8)
+            np.ndarray((length,), dtype=np.float64, buffer=job.shm.buf)[:] = job.series
+            job.future = executor.submit(_train_worker, job.shm.name, length, self.model_types)
+            return job.future
+        except Exception as exc:
+            self._release(job)
+            self._finish(job, 'failed', error=str(exc))
+            return None
+
+    def _complete(self, job, future):
+        self._release(job)
+        if future.cancelled():
+            self._finish(job, 'cancelled')
+            return
+        try:
+            result = future.result()
+        except Exception as exc:
+            self._finish(job, 'failed', error=str(exc))
+        else:
+            self._finish(job, 'done', result=result)
+
+    def _finish(self, job, status, result=None, error=None):
+        with self._lock:
+            # A job cancelled while running keeps its cancelled status
+            if job.status == 'running':
+                job.status = status
+                job.result = result
+                job.error = error
+            job.series = None
+            job.future = None
+        if self.on_progress is not None:
+            self.on_progress(job, self.progress())
+
+    @staticmethod
+    def _release(job):
+        if job.shm is not None:
+            job.shm.close()
+            try:
+                job.shm.unlink()
+            except FileNotFoundError:
+                pass
+            job.shm = None